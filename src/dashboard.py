@@ -1,29 +1,60 @@
 import os
+from functools import lru_cache
 import pandas as pd
 from shiny import App, ui, render, reactive
+import plotly
 import plotly.express as px
+import plotly.graph_objects as go
 import plotly.io as pio
+from plotly.offline import get_plotlyjs_version
 from htmltools import HTML
 
+# --- WebGL support ---
+# Text labels on WebGL traces can silently render empty on Plotly < 5.0. The base traces
+# therefore carry no text (tickers show on hover), and only the single labelled highlight
+# trace falls back to SVG on those releases.
+try:
+    WEBGL_TEXT_OK = tuple(int(p) for p in plotly.__version__.split(".")[:2]) >= (5, 0)
+except ValueError:
+    WEBGL_TEXT_OK = False
+HighlightScatter = go.Scattergl if WEBGL_TEXT_OK else go.Scatter
+
+# plotly.js is loaded once in the page head, pinned to the version this plotly release targets
+PLOTLY_JS_URL = f"https://cdn.plot.ly/plotly-{get_plotlyjs_version()}.min.js"
+
 # --- Load summary data ---
+SUMMARY_DTYPES = {
+    "Name": "string[pyarrow]",
+    "Ticker": "string[pyarrow]",
+    "Average_Return": "float32[pyarrow]",
+    "VaR": "float32[pyarrow]",
+    "ES": "float32[pyarrow]",
+    "Average_Return_Rank": "int64[pyarrow]",
+    "VaR_Rank": "int64[pyarrow]",
+    "ES_Rank": "int64[pyarrow]",
+}
+
+
 def load_summary_data():
     script_dir = os.path.dirname(os.path.abspath(__file__))
     file_path = os.path.join(script_dir, "..", "data", "stock_summary.csv")
-    df = pd.read_csv(file_path)
+    df = pd.read_csv(file_path, dtype=SUMMARY_DTYPES, engine="pyarrow", dtype_backend="pyarrow")
 
-    # Clean string columns
-    for col in df.select_dtypes(include='object').columns:
-        df[col] = df[col].str.strip()
-    df["Ticker"] = df["Ticker"].str.upper()
+    # Clean string columns (Arrow string kernels, one pass per column)
+    df["Ticker"] = df["Ticker"].str.strip().str.upper()
+    df["Name"] = df["Name"].str.strip()
 
+    # Index by ticker so selections are hash lookups
+    df.set_index("Ticker", inplace=True)
     return df
 
 # --- Build Shiny app ---
 def build_shiny_app(df_summary):
-    ticker_list = df_summary["Ticker"].tolist()
+    ticker_list = df_summary.index.tolist()
     default_ticker = ticker_list[0]
 
     app_ui = ui.page_fluid(
+        ui.head_content(ui.tags.script(src=PLOTLY_JS_URL)),
         ui.panel_title("📊 Stock Risk Dashboard"),
         ui.input_select("stock", "Choose a Stock", choices=ticker_list, selected=default_ticker),
         ui.output_ui("metrics_table"),
@@ -34,12 +65,46 @@ def build_shiny_app(df_summary):
         )
     )
 
+    # Base scatter plots are built once; only the highlight trace depends on the selection
+    base_figs = {
+        measure: px.scatter(
+            df_summary,
+            x="Average_Return",
+            y=measure,
+            hover_name=df_summary.index,
+            title=f"Average Return vs {measure}",
+            render_mode="webgl"
+        )
+        for measure in ("VaR", "ES")
+    }
+
+    def plot_to_html(fig):
+        return HTML(pio.to_html(fig, full_html=False, include_plotlyjs=False, config={"displayModeBar": False}))
+
+    @lru_cache(maxsize=2 * len(ticker_list))
+    def scatter_html(ticker, measure):
+        """Returns the base plot for measure with ticker highlighted, as HTML."""
+        s = df_summary.loc[ticker]
+        fig = go.Figure(base_figs[measure])
+        fig.add_trace(HighlightScatter(
+            x=[s["Average_Return"]],
+            y=[s[measure]],
+            mode="markers+text",
+            name=ticker,
+            marker=dict(size=12, color="red"),
+            text=[ticker],
+            textposition="top center"
+        ))
+        return plot_to_html(fig)
+
     def server(input, output, session):
         @reactive.Calc
         def selected_row():
             selected = input.stock()
-            row = df_summary[df_summary["Ticker"] == selected.strip().upper()]
-            return row.iloc[0] if not row.empty else None
+            try:
+                return df_summary.loc[selected.strip().upper()]
+            except KeyError:
+                return None
 
         @output
         @render.ui
@@ -49,7 +114,7 @@ def build_shiny_app(df_summary):
                 return "No data"
 
             name = s["Name"]
-            ticker = s["Ticker"]
+            ticker = s.name
             n_companies = len(df_summary)
 
             avg_return = f"{s['Average_Return']:.2f}%"
@@ -102,32 +167,13 @@ def build_shiny_app(df_summary):
 
 
 
-        def plot_to_html(fig):
-            return HTML(pio.to_html(fig, full_html=False, include_plotlyjs="cdn"))
-
         @output
         @render.ui
         def scatter_var():
             s = selected_row()
             if s is None:
                 return "No data"
-            fig = px.scatter(
-                df_summary,
-                x="Average_Return",
-                y="VaR",
-                text="Ticker",
-                title="Average Return vs VaR"
-            )
-            fig.add_scatter(
-                x=[s["Average_Return"]],
-                y=[s["VaR"]],
-                mode="markers+text",
-                name=s["Ticker"],
-                marker=dict(size=12, color="red"),
-                text=[s["Ticker"]],
-                textposition="top center"
-            )
-            return plot_to_html(fig)
+            return scatter_html(s.name, "VaR")
 
         @output
         @render.ui
@@ -135,23 +181,7 @@ def build_shiny_app(df_summary):
             s = selected_row()
             if s is None:
                 return "No data"
-            fig = px.scatter(
-                df_summary,
-                x="Average_Return",
-                y="ES",
-                text="Ticker",
-                title="Average Return vs ES"
-            )
-            fig.add_scatter(
-                x=[s["Average_Return"]],
-                y=[s["ES"]],
-                mode="markers+text",
-                name=s["Ticker"],
-                marker=dict(size=12, color="red"),
-                text=[s["Ticker"]],
-                textposition="top center"
-            )
-            return plot_to_html(fig)
+            return scatter_html(s.name, "ES")
 
     return App(app_ui, server)
 
@@ -161,4 +191,3 @@ app = build_shiny_app(df_summary)
 
 if __name__ == "__main__":
     app.run()
-    app.run()
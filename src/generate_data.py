@@ -1,35 +1,48 @@
 import os
+import time
+import json
 import pandas as pd
 import numpy as np
 import yfinance as yf
-from scipy.stats import genpareto
-from scipy.ndimage import gaussian_filter1d
-from scipy.optimize import minimize
-from typing import Dict, List, Union
+import pyarrow as pa
+import pyarrow.parquet as pq
+from typing import Dict, List
+from hill_kernels import gaussian_kernel, batch_hill
 
 # --- Configuration ---
 START_DATE = "2022-01-01"
 END_DATE = "2024-12-31"
 LOSS_THRESHOLD = 30
 HILL_K_MIN = 5
+HILL_K_MAX = 150
 HILL_K_MAX_FACTOR = 0.95
 HILL_SIGMA = 2
 SELECT_K_SIGMA = 5
 GPD_ALPHA = 0.95
 MIN_EXCEEDANCES = 5
+GPD_SHAPE_EPS = 1e-8
+NEWTON_TOL = 1e-10
+NEWTON_MAX_ITER = 50
+
+# --- Gaussian smoothing kernels (same weights as gaussian_filter1d, built once) ---
+HILL_KERNEL = gaussian_kernel(HILL_SIGMA)
+SELECT_K_KERNEL = gaussian_kernel(SELECT_K_SIGMA)
 
 # --- File Paths ---
 SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
 DATA_DIR = os.path.join(SCRIPT_DIR, "..", "data")
 OUTPUT_FILE = os.path.join(DATA_DIR, "stock_summary.csv")
 TICKERS_FILE = os.path.join(DATA_DIR, "Stocks.xlsx")
+PRICE_CACHE_FILE = os.path.join(DATA_DIR, f"prices_{START_DATE}_{END_DATE}.parquet")
+PRICE_CACHE_TTL = 24 * 60 * 60  # Seconds, per ticker
+PRICE_CACHE_META_KEY = b"fetched_at"
 
 # --- Ensure data directory exists ---
 os.makedirs(DATA_DIR, exist_ok=True)
 
 # --- Data Structures ---
 PriceData = Dict[str, pd.DataFrame]
-RiskRecord = Dict[str, Union[float, str]]
+RISK_DTYPE = np.dtype([("Average_Return", "f8"), ("VaR", "f8"), ("ES", "f8")])
 
 # --- Read tickers ---
 def read_tickers() -> pd.DataFrame:
@@ -44,88 +57,85 @@ def read_tickers() -> pd.DataFrame:
 
 # --- Download prices ---
 def download_prices(ticker_list: List[str]) -> PriceData:
+    """Returns prices per ticker, served from the Parquet cache where fresh and downloading the rest."""
+    cached, fetched_at = load_price_cache()
+    results: PriceData = {t: cached[t] for t in ticker_list if t in cached}
+    missing = [t for t in ticker_list if t not in results]
+    if missing:
+        downloaded = fetch_prices(missing)
+        if downloaded:
+            results.update(downloaded)
+            now = time.time()
+            save_price_cache({**cached, **downloaded}, {**fetched_at, **{t: now for t in downloaded}})
+    return results
+
+def fetch_prices(ticker_list: List[str]) -> PriceData:
     results: PriceData = {}
+    print(f"Downloading {len(ticker_list)} tickers")
+    try:
+        data = yf.download(tickers=ticker_list, start=START_DATE, end=END_DATE, group_by="ticker", threads=True, progress=False, auto_adjust=False)
+    except Exception as e:
+        print(f"Error fetching prices: {e}")
+        return results
+    downloaded = set(data.columns.get_level_values(0)) if isinstance(data.columns, pd.MultiIndex) else set()
     for ticker in ticker_list:
-        print(f"Downloading: {ticker}")
+        if ticker not in downloaded:
+            print(f"No data returned for {ticker}")
+            continue
         try:
-            df = yf.download(ticker, start=START_DATE, end=END_DATE, progress=False)[["Open", "Close"]].dropna()
+            df = data[ticker][["Open", "Close"]].dropna()
             if not df.empty:
                 results[ticker] = df
         except Exception as e:
             print(f"Error fetching {ticker}: {e}")
     return results
 
-# --- Hill estimator functions ---
-def hill_estimator(data: np.ndarray, k_vals: np.ndarray) -> np.ndarray:
-    """Performs Hill estimation and smooths output."""
-    data_sorted = np.sort(data)[::-1]
-    return gaussian_filter1d([np.mean(np.log(data_sorted[:k]) - np.log(data_sorted[k])) if k < len(data_sorted) else np.nan for k in k_vals], sigma=HILL_SIGMA)
-
-def select_k(smoothed: np.ndarray, k_vals: np.ndarray) -> int:
-    """Finds optimal k such that zero gradient of Hill estimator -- "Eye-ball method". """
-    return k_vals[np.argmin(gaussian_filter1d(np.abs(np.gradient(smoothed)), sigma=SELECT_K_SIGMA))]
-
-def estimate_hill_shape(data: np.ndarray, k: int) -> float:
-    """Estimates the shape parameter using the Hill estimator for optimal k."""
-    data_sorted = np.sort(data)[::-1]
-    if k >= len(data_sorted) or k <= 0:
-        raise ValueError("k must be a valid index within the data")
-    return np.mean(np.log(data_sorted[:k]) - np.log(data_sorted[k]))
-
-# --- GPD fitting using MLE (with fixed shape) to extract scale parameter ---
-def gpd_log_likelihood_fixed_shape(scale, data, shape):
-    """Log-likelihood function for the GPD with a fixed shape parameter from above."""
-    if scale <= 0:
-        return np.inf
+# --- Price cache ---
+# Each ticker's download time is kept in the Parquet schema metadata, so the TTL applies per
+# ticker: fetching a new ticker does not extend the life of the older cached ones.
+def load_price_cache() -> tuple[PriceData, Dict[str, float]]:
+    """Returns the cached tickers still within PRICE_CACHE_TTL, with their download times."""
+    if not os.path.exists(PRICE_CACHE_FILE):
+        return {}, {}
     try:
-        return -np.sum(genpareto.logpdf(data, shape, loc=0, scale=scale))
-    except Exception:
-        return np.inf
-
-def fit_gpd_mle_fixed_shape(data: np.ndarray, shape: float) -> Union[float, None]:
-    """Fits the GPD scale parameter using MLE, with the shape parameter fixed."""
-    if len(data) < MIN_EXCEEDANCES:
-        return None
-    initial_guess = np.std(data)  # Initial guess for scale
-    bounds = [(1e-6, np.inf)]  # Scale must be positive
-    result = minimize(gpd_log_likelihood_fixed_shape, initial_guess, args=(data, shape), bounds=bounds, method='L-BFGS-B')
-    if result.success:
-        return float(result.x[0])
-    else:
-        print(f"MLE fitting failed: {result.message}")
-        return None
+        table = pq.read_table(PRICE_CACHE_FILE)
+        fetched_at = json.loads((table.schema.metadata or {}).get(PRICE_CACHE_META_KEY, b"{}"))
+        data = table.to_pandas()
+    except Exception as e:
+        print(f"Error reading price cache: {e}")
+        return {}, {}
+    now = time.time()
+    fresh = {t: ts for t, ts in fetched_at.items() if now - ts <= PRICE_CACHE_TTL and t in data.columns.get_level_values(0)}
+    if fresh:
+        print(f"Loaded {len(fresh)} cached tickers from: {PRICE_CACHE_FILE}")
+    return {t: data[t].dropna() for t in fresh}, fresh
+
+def save_price_cache(prices: PriceData, fetched_at: Dict[str, float]):
+    try:
+        table = pa.Table.from_pandas(pd.concat(prices, axis=1))
+        metadata = {**(table.schema.metadata or {}), PRICE_CACHE_META_KEY: json.dumps(fetched_at).encode()}
+        pq.write_table(table.replace_schema_metadata(metadata), PRICE_CACHE_FILE, compression="zstd")
+    except Exception as e:
+        print(f"Error writing price cache: {e}")
 
 # --- Returns risk measures -- Value at Risk and Expected Shortfall ---
-def compute_gpd_risks_mle(data: np.ndarray, threshold: float, alpha: float = GPD_ALPHA) -> tuple[Union[float, None], Union[float, None]]:
-    """ Returns risk measures -- Value at Risk and Expected Shortfall """
-    exceed = data[data > threshold] - threshold
-    if len(exceed) < MIN_EXCEEDANCES:
-        return None, None
-    k_vals = np.arange(HILL_K_MIN, min(len(exceed) - 10, 150))
-    if len(k_vals) < 2:
-        return None, None
-    smoothed = hill_estimator(exceed, k_vals)
-    k_star = select_k(smoothed, k_vals)
-    shape = estimate_hill_shape(exceed, k_star)
-    scale = fit_gpd_mle_fixed_shape(exceed, shape)
-
-    if scale is not None:
-        q = 1 - alpha
-        if shape == 0:
-            var = threshold + scale * np.log(1 / q)
-            es = threshold + scale * (np.log(1 / q) + 1)
-        elif shape > 0:
-            var = threshold + (scale / shape) * ((1 / q)**shape - 1)
-            es = threshold + (var - threshold + scale) / (1 - shape)
-        else:
-            var = threshold + (scale / shape) * ((1 / q)**shape - 1)
-            es = threshold + (var - threshold + scale) / (1 - shape)
-        return float(var.item()), float(es.item())  # Changed this line
-    return None, None
+def gpd_var_es(threshold: float, shape: float, scale: float, alpha: float = GPD_ALPHA) -> tuple[float, float]:
+    """ Value at Risk and Expected Shortfall of the fitted GPD tail """
+    q = 1 - alpha
+    if shape == 0:
+        var = threshold + scale * np.log(1 / q)
+        es = threshold + scale * (np.log(1 / q) + 1)
+    else:
+        var = threshold + (scale / shape) * ((1 / q)**shape - 1)
+        es = threshold + (var - threshold + scale) / (1 - shape)
+    return float(var), float(es)
 
 # --- Compute risks and return ---
 def compute_risks(prices: PriceData, metadata: pd.DataFrame) -> pd.DataFrame:
-    records: List[RiskRecord] = []
+    names: List[str] = []
+    tickers: List[str] = []
+    avg_returns: List[float] = []
+    loss_arrays: List[np.ndarray] = []
     for ticker, df in prices.items():
         try:
             daily_ret = (df["Close"] - df["Open"]) / df["Open"] * 100
@@ -133,25 +143,47 @@ def compute_risks(prices: PriceData, metadata: pd.DataFrame) -> pd.DataFrame:
             if len(losses) < LOSS_THRESHOLD:
                 print(f"Insufficient loss data for {ticker}. Skipping.")
                 continue
-            k_vals = np.arange(HILL_K_MIN, min(len(losses) - 10, 150))
+            k_vals = np.arange(HILL_K_MIN, min(len(losses) - 10, HILL_K_MAX))
             if len(k_vals) < 2:
                 print(f"Insufficient k values for Hill estimator for {ticker}. Skipping.")
                 continue
-            smoothed = hill_estimator(losses, k_vals)
-            threshold = np.sort(losses)[::-1][select_k(smoothed, k_vals)]
-            var, es = compute_gpd_risks_mle(losses, threshold)
             avg_return = daily_ret.mean().item() if isinstance(daily_ret.mean(), pd.Series) else float(daily_ret.mean())
             name = metadata.loc[metadata["Ticker"] == ticker, "Company_Name"].iloc[0] if not metadata.loc[metadata["Ticker"] == ticker, "Company_Name"].empty else ticker
-            records.append({
-                "Name": name,
-                "Ticker": ticker,
-                "Average_Return": avg_return,
-                "VaR": var,
-                "ES": es,
-            })
+            loss_arrays.append(np.asarray(losses, dtype=np.float64).ravel())
+            avg_returns.append(avg_return)
+            names.append(name)
+            tickers.append(ticker)
         except Exception as e:
             print(f"Error processing {ticker}: {e}")
-    summary_df = pd.DataFrame(records)
+
+    # Fit every ticker's tail in one parallel pass over a padded losses matrix
+    n = len(loss_arrays)
+    lengths = np.array([len(l) for l in loss_arrays], dtype=np.int64)
+    losses_mat = np.full((n, lengths.max(initial=0)), np.nan)
+    for i, l in enumerate(loss_arrays):
+        losses_mat[i, :len(l)] = l
+    thresholds, shapes, scales = np.empty(n), np.empty(n), np.empty(n)
+    batch_hill(losses_mat, lengths, HILL_KERNEL, SELECT_K_KERNEL, HILL_K_MIN, HILL_K_MAX, MIN_EXCEEDANCES,
+               GPD_SHAPE_EPS, NEWTON_TOL, NEWTON_MAX_ITER, thresholds, shapes, scales)
+
+    # Column-wise (SoA) storage: one float64 record per ticker, filled by index
+    metrics = np.empty(n, dtype=RISK_DTYPE)
+    metrics["Average_Return"] = avg_returns
+    for i in range(n):
+        if np.isfinite(thresholds[i]) and np.isnan(shapes[i]):
+            print(f"Insufficient exceedances to fit GPD for {tickers[i]}.")
+        elif np.isfinite(shapes[i]) and np.isnan(scales[i]):
+            print(f"MLE fitting failed for {tickers[i]}: no convergence after {NEWTON_MAX_ITER} iterations")
+        var, es = gpd_var_es(thresholds[i], shapes[i], scales[i]) if np.isfinite(scales[i]) else (np.nan, np.nan)
+        metrics["VaR"][i] = var
+        metrics["ES"][i] = es
+    summary_df = pd.DataFrame({
+        "Name": names,
+        "Ticker": tickers,
+        "Average_Return": metrics["Average_Return"],
+        "VaR": metrics["VaR"],
+        "ES": metrics["ES"],
+    })
     for col in ['Average_Return', 'VaR', 'ES']: # Exclude 'Scale'
         if col in summary_df.columns:
             summary_df[f"{col}_Rank"] = summary_df[col].rank(ascending=(col == 'Average_Return'), na_option='bottom').astype('Int64')
@@ -0,0 +1,151 @@
+import numpy as np
+from numba import njit, prange
+
+# --- Compilation settings ---
+# Array arguments are declared C-contiguous ([::1]) so loops vectorize; callers pass contiguous copies.
+# fastmath without the "nnan"/"ninf" flags: the kernels rely on NaN and inf as sentinels.
+FASTMATH = {"nsz", "arcp", "contract", "afn", "reassoc"}
+# Explicit signatures compile at import; cache=True persists the machine code in __pycache__,
+# so later runs skip JIT warm-up entirely.
+JIT_OPTIONS = dict(cache=True, fastmath=FASTMATH, boundscheck=False)
+
+# --- Hill estimator kernels ---
+@njit("float64[::1](float64[::1], int64[::1])", **JIT_OPTIONS)
+def hill_vals(sorted_desc, k_vals):
+    """Unsmoothed Hill estimates for each k, from data sorted in descending order (NaN where k is out of range)."""
+    n = len(sorted_desc)
+    out = np.empty(len(k_vals))
+    csum = np.empty(n)
+    acc = 0.0
+    for i in range(n):
+        acc += np.log(sorted_desc[i])
+        csum[i] = acc
+    for j in range(len(k_vals)):
+        k = k_vals[j]
+        if 0 < k < n:
+            out[j] = csum[k - 1] / k - np.log(sorted_desc[k])
+        else:
+            out[j] = np.nan
+    return out
+
+@njit("int64(float64[::1])", **JIT_OPTIONS)
+def select_k_argmin(abs_grad):
+    """Index of the smallest (smoothed) absolute gradient; the first NaN wins, as with np.argmin."""
+    best = 0
+    for i in range(len(abs_grad)):
+        if np.isnan(abs_grad[i]):
+            return i
+        if abs_grad[i] < abs_grad[best]:
+            best = i
+    return best
+
+# --- GPD kernels ---
+@njit("float64(float64[::1], float64, float64, float64, int64)", **JIT_OPTIONS)
+def gpd_scale_newton(data, shape, shape_eps, tol, max_iter):
+    """Scale MLE of the GPD (loc=0) at fixed shape; NaN if Newton does not converge.
+
+    Solves (1 + shape) * sum(x / (scale + shape * x)) = n, which is decreasing and convex in scale.
+    """
+    if abs(shape) < shape_eps:
+        return np.mean(data)  # Exponential MLE
+    n = len(data)
+    lower = max(0.0, -shape * np.max(data))  # Support requires scale + shape * x > 0
+    scale = max(np.std(data), lower + 1e-6)
+    for _ in range(max_iter):
+        g = 0.0
+        dg = 0.0
+        for i in range(n):
+            denom = scale + shape * data[i]
+            g += data[i] / denom
+            dg += data[i] / (denom * denom)
+        g = (1 + shape) * g - n
+        dg = -(1 + shape) * dg
+        new_scale = scale - g / dg
+        if not new_scale > lower:
+            new_scale = (scale + lower) / 2  # Step left the feasible region -- bisect towards its edge
+        if abs(new_scale - scale) < tol * scale:
+            return new_scale
+        scale = new_scale
+    return np.nan
+
+# --- Smoothing kernels ---
+def gaussian_kernel(sigma, truncate=4.0):
+    """Normalized Gaussian weights, matching scipy.ndimage.gaussian_filter1d's kernel."""
+    radius = int(truncate * sigma + 0.5)
+    x = np.arange(-radius, radius + 1)
+    kern = np.exp(-0.5 * (x / sigma) ** 2)
+    return kern / kern.sum()
+
+@njit("float64[::1](float64[::1], float64[::1])", **JIT_OPTIONS)
+def smooth(x, kern):
+    """Correlates x with a symmetric kernel using scipy.ndimage's default 'reflect' boundary."""
+    n = len(x)
+    r = len(kern) // 2
+    out = np.empty(n)
+    for i in range(n):
+        acc = 0.0
+        for j in range(-r, r + 1):
+            m = (i + j) % (2 * n)
+            if m >= n:
+                m = 2 * n - 1 - m
+            acc += x[m] * kern[j + r]
+        out[i] = acc
+    return out
+
+@njit("float64[::1](float64[::1])", **JIT_OPTIONS)
+def abs_gradient(x):
+    """|np.gradient(x)| for unit spacing (len(x) >= 2)."""
+    n = len(x)
+    out = np.empty(n)
+    out[0] = abs(x[1] - x[0])
+    for i in range(1, n - 1):
+        out[i] = abs(x[i + 1] - x[i - 1]) / 2
+    out[n - 1] = abs(x[n - 1] - x[n - 2])
+    return out
+
+@njit("int64(float64[::1], int64[::1], float64[::1], float64[::1])", **JIT_OPTIONS)
+def select_k_smoothed(sorted_desc, k_vals, hill_kern, select_kern):
+    """Optimal k: smoothed Hill plot, then the argmin of its smoothed absolute gradient."""
+    return k_vals[select_k_argmin(smooth(abs_gradient(smooth(hill_vals(sorted_desc, k_vals), hill_kern)), select_kern))]
+
+# --- Batch pipeline ---
+@njit("void(float64[:, ::1], int64[::1], float64[::1], float64[::1], int64, int64, int64, float64, float64, int64, float64[::1], float64[::1], float64[::1])",
+      parallel=True, **JIT_OPTIONS)
+def batch_hill(losses_mat, lengths, hill_kern, select_kern, k_min, k_max, min_exceed, shape_eps, tol, max_iter,
+               out_threshold, out_shape, out_scale):
+    """Threshold, Hill shape and GPD scale for each row of losses_mat (first lengths[i] entries).
+
+    One ticker per thread. A NaN threshold means too little data, a NaN shape too few exceedances,
+    and a NaN scale alone a non-converged Newton fit.
+    """
+    for i in prange(len(lengths)):
+        out_threshold[i] = np.nan
+        out_shape[i] = np.nan
+        out_scale[i] = np.nan
+        n = lengths[i]
+        x = np.sort(losses_mat[i, :n])[::-1].copy()
+        k_hi = min(n - 10, k_max)
+        if k_hi - k_min < 2:
+            continue
+        threshold = x[select_k_smoothed(x, np.arange(k_min, k_hi), hill_kern, select_kern)]
+        out_threshold[i] = threshold
+
+        # Exceedances: the prefix of x above the threshold, still sorted descending
+        m = 0
+        while m < n and x[m] > threshold:
+            m += 1
+        if m < min_exceed:
+            continue
+        exceed = x[:m] - threshold
+        k_hi = min(m - 10, k_max)
+        if k_hi - k_min < 2:
+            continue
+        k = select_k_smoothed(exceed, np.arange(k_min, k_hi), hill_kern, select_kern)
+        if k <= 0 or k >= m:
+            continue
+        shape = 0.0
+        for j in range(k):
+            shape += np.log(exceed[j])
+        shape = shape / k - np.log(exceed[k])
+        out_shape[i] = shape
+        out_scale[i] = gpd_scale_newton(exceed, shape, shape_eps, tol, max_iter)
@@ -3,8 +3,9 @@ import pandas as pd
 import numpy as np
 import yfinance as yf
 import matplotlib.pyplot as plt
-from scipy.stats import genpareto
+from scipy.optimize import minimize_scalar
 from scipy.ndimage import gaussian_filter1d
+from hill_kernels import gpd_scale_newton
 
 # --- Read tickers ---
 def read_tickers() -> list:
@@ -36,10 +37,13 @@ def fetch_stock_data(tickers: list) -> pd.DataFrame:
 # --- Hill Estimator ---
 def hill_estimator(data, k_values):
     data = np.sort(data)[::-1]
-    return np.array([
-        np.mean(np.log(data[:k]) - np.log(data[k])) if k < len(data) else np.nan
-        for k in k_values
-    ])
+    k_values = np.asarray(k_values)
+    logs = np.log(data)
+    csum = np.cumsum(logs)
+    valid = k_values < len(data)
+    vals = np.full(k_values.shape, np.nan)
+    vals[valid] = csum[k_values[valid] - 1] / k_values[valid] - logs[k_values[valid]]
+    return vals
 
 # Smooths Hill estimator
 def smoothed_hill_estimator(data, k_values, sigma=2):
@@ -47,15 +51,44 @@ def smoothed_hill_estimator(data, k_values, sigma=2):
 
 # Returns optimal order statistics (scalar)
 def select_optimal_k(smoothed_hill: np.ndarray, k_values: np.ndarray, window: int = 5) -> int:
-    slope = np.abs(np.gradient(smoothed_hill))
+    slope = np.gradient(smoothed_hill)
+    np.abs(slope, out=slope)
     slope_smooth = gaussian_filter1d(slope, sigma=window)
     min_slope_idx = np.argmin(slope_smooth)
     return k_values[min_slope_idx]
 
 # Returns optimal xi (scalar) based on optimal order statistc
 def compute_final_xi(data, optimal_k):
-    data = np.sort(data)[::-1]
-    return np.mean(np.log(data[:optimal_k]) - np.log(data[optimal_k]))
+    top = -np.partition(-np.asarray(data), optimal_k)[:optimal_k + 1]  # k largest (unordered), then the (k+1)-th
+    return np.mean(np.log(top[:optimal_k])) - np.log(top[optimal_k])
+
+# --- GPD fit (loc = 0) by profile likelihood ---
+GPD_SHAPE_EPS = 1e-8
+NEWTON_TOL = 1e-10
+NEWTON_MAX_ITER = 50
+
+# Scale MLE for a fixed shape (NaN if the Newton iteration does not converge)
+def _gpd_scale_mle(x: np.ndarray, shape: float) -> float:
+    return gpd_scale_newton(x, float(shape), GPD_SHAPE_EPS, NEWTON_TOL, NEWTON_MAX_ITER)
+
+def _gpd_neg_log_likelihood(x: np.ndarray, shape: float, scale: float) -> float:
+    if abs(shape) < GPD_SHAPE_EPS:
+        return len(x) * np.log(scale) + np.sum(x) / scale
+    t = shape * x / scale
+    if np.any(t <= -1):
+        return np.inf
+    return len(x) * np.log(scale) + (1 + 1 / shape) * np.sum(np.log1p(t))
+
+# Returns (shape, scale), maximizing the profile likelihood over shape
+def _gpd_fit(x: np.ndarray, shape_bounds: tuple = (-0.5, 2.0)):
+    x = np.ascontiguousarray(x, dtype=np.float64)
+
+    def profile(shape):
+        scale = _gpd_scale_mle(x, shape)
+        return np.inf if np.isnan(scale) else _gpd_neg_log_likelihood(x, shape, scale)
+
+    shape = minimize_scalar(profile, bounds=shape_bounds, method="bounded", options={"xatol": 1e-8}).x
+    return float(shape), _gpd_scale_mle(x, shape)
 
 # --- GPD VaR & ES ---
 def estimate_var_es_gpd(data: np.ndarray, threshold: float, confidence_level: float = 0.95):
@@ -63,7 +96,7 @@ def estimate_var_es_gpd(data: np.ndarray, threshold: float, confidence_level: fl
     if len(exceedances) < 2:
         raise ValueError("Not enough exceedances above threshold to fit GPD.")
 
-    shape, loc, scale = genpareto.fit(exceedances)
+    shape, scale = _gpd_fit(exceedances)
 
     prob = 1 - confidence_level
     var = threshold + (scale / shape) * ((1 / prob) ** shape - 1)
@@ -96,8 +129,7 @@ if __name__ == "__main__":
         optimal_k = select_optimal_k(smoothed_vals, k_values)
         xi = compute_final_xi(data, optimal_k)
 
-        sorted_data = np.sort(data)[::-1]
-        threshold = sorted_data[optimal_k]
+        threshold = -np.partition(-data, optimal_k)[optimal_k]  # (optimal_k+1)-th largest loss, no full sort
 
         try:
             var_95, es_95, shape, scale = estimate_var_es_gpd(data, threshold, confidence_level=0.95)
@@ -132,10 +164,11 @@ if __name__ == "__main__":
 
         for delta in [-10, 0, 10]:
             test_k = optimal_k + delta
-            if test_k < len(data):
-             thresh = np.sort(data)[::-1][test_k]
+            if not 0 <= test_k < len(data):
+                continue
+            thresh = -np.partition(-data, test_k)[test_k]
             try:
-                shape, loc, scale = genpareto.fit(data[data > thresh] - thresh)
+                shape, scale = _gpd_fit(data[data > thresh] - thresh)
                 print(f"k={test_k}, shape={shape:.4f}, threshold={thresh:.4f}")
             except Exception as e:
                 print(f"Error with k={test_k}: {e}")